@@ -1,7 +1,11 @@
 import bcrypt
+import hashlib
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
+import jwt
+from jwt import InvalidTokenError as JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from config import settings
@@ -30,12 +34,32 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
 
+# Bounded TTL cache of decoded payloads so repeat requests with the same token
+# skip HMAC verification + JSON parsing. Keyed on a blake2b digest of the raw
+# token to bound memory; entries live at most _TOKEN_CACHE_TTL seconds so
+# expiry semantics stay tight.
+_TOKEN_CACHE_TTL = 60  # seconds
+_TOKEN_CACHE_MAX = 10_000
+_token_cache: dict = {}  # digest -> (payload, cached_at)
+_token_cache_lock = threading.Lock()
+
+
 def decode_token(token: str) -> dict:
+    now = time.time()
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is not None:
+            payload, cached_at = entry
+            if now - cached_at < _TOKEN_CACHE_TTL and payload.get("exp", 0) > now:
+                return payload
+            del _token_cache[key]
+
     try:
         payload = jwt.decode(
             token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM]
         )
-        return payload
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -43,6 +67,15 @@ def decode_token(token: str) -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    with _token_cache_lock:
+        if len(_token_cache) >= _TOKEN_CACHE_MAX:
+            # Evict the oldest entries (insertion order) to stay bounded
+            for old_key in list(_token_cache)[: _TOKEN_CACHE_MAX // 10]:
+                del _token_cache[old_key]
+        _token_cache[key] = (payload, now)
+
+    return payload
+
 
 # ── Dependency ────────────────────────────────────────────────────────────────
 
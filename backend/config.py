@@ -9,6 +9,10 @@ class Settings:
     SUPABASE_ANON_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
     SUPABASE_SERVICE_ROLE_KEY: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
 
+    # Direct Postgres connection string (Supabase > Settings > Database)
+    # Used by the asyncpg pool for all queries; REST client only does Storage.
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+
     # LLM Provider: "gemini" (default) or "openrouter"
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "gemini")
 
@@ -32,7 +36,16 @@ class Settings:
     EMBEDDING_MODEL: str = os.getenv(
         "EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
     )
-    EMBEDDING_DIM: int = 384
+    # "torch" (default), "onnx-int8", or "model2vec":
+    #   onnx-int8 — dynamic-quantized MiniLM on ONNX Runtime, ~2-3x faster on
+    #     CPUs with AVX512-VNNI. Needs: pip install sentence-transformers[onnx]
+    #   model2vec — static embeddings (lookup + mean pool), 100x+ faster on CPU
+    #     with some recall loss. Needs: pip install model2vec, EMBEDDING_MODEL
+    #     set to a model2vec checkpoint (e.g. minishlab/potion-base-8M) and
+    #     EMBEDDING_DIM + the pgvector column re-provisioned to its dimension.
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    # Must match the pgvector halfvec column dimension
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "384"))
 
     # RAG settings
     CHUNK_SIZE: int = 256       # tokens per sentence window chunk
@@ -43,13 +56,15 @@ class Settings:
 
     # App
     APP_NAME: str = "DocKnowledge Q&A"
-    CORS_ORIGINS: list = [
-        x for x in [
+    # frozenset: O(1) membership checks in the CORS middleware, with trailing
+    # slashes normalized once at startup instead of per-request
+    CORS_ORIGINS: frozenset = frozenset(
+        x.rstrip("/") for x in [
             "http://localhost:3000",
             "https://localhost:3000",
             os.getenv("FRONTEND_URL", ""),
         ] if x  # filter out empty strings
-    ]
+    )
 
 
 settings = Settings()
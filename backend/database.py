@@ -1,202 +1,368 @@
 """
 Database layer — Supabase (PostgreSQL + pgvector + Storage)
-All queries use the Supabase REST API via the `supabase-py` client.
+Queries go straight to Postgres over an asyncpg connection pool (binary wire
+protocol, no per-query HTTP round-trip). The `supabase-py` REST client is kept
+only for Storage operations.
 """
+import asyncio
+import functools
 import logging
+import uuid as uuid_lib
+from datetime import datetime
 from typing import List, Optional, Dict, Any
+
+import asyncpg
+# HalfVector comes from the asyncpg submodule: the top-level re-export only
+# exists from pgvector 0.4.0, and requirements allow 0.3.x
+from pgvector.asyncpg import HalfVector, register_vector
 from supabase import create_client, Client
+
 from config import settings
 from auth import hash_password
 
 logger = logging.getLogger(__name__)
 
-# ── Client ────────────────────────────────────────────────────────────────────
+# ── Clients ───────────────────────────────────────────────────────────────────
 
+@functools.lru_cache(maxsize=1)
 def get_supabase() -> Client:
-    """Return a Supabase client with the service role key (bypasses RLS for server-side ops)."""
+    """
+    Return the Supabase client (service role key, bypasses RLS). Built lazily
+    on first use — importing this module no longer triggers client setup,
+    which keeps worker startup cheap and unit imports side-effect free.
+    """
     return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
 
 
-supabase: Client = get_supabase()
+_pool: Optional[asyncpg.Pool] = None
 
 
-# ── Auth / Users ──────────────────────────────────────────────────────────────
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Register the pgvector codec so embeddings travel in binary, not JSON."""
+    await register_vector(conn)
 
-def create_user(email: str, password: str, name: Optional[str] = None) -> Dict:
-    """Register a new user. Raises on duplicate email."""
-    # Check if user already exists
+
+async def init_pool() -> None:
+    """Create the asyncpg pool. Called once from the FastAPI lifespan handler."""
+    global _pool
+    if _pool is not None:
+        return
+    _pool = await asyncpg.create_pool(
+        settings.DATABASE_URL,
+        min_size=2,
+        max_size=20,
+        init=_init_connection,
+    )
+    logger.info("asyncpg pool created.")
+    await refresh_hnsw_tuning()
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise RuntimeError("Database pool not initialized — call init_pool() first")
+    return _pool
+
+
+# ── HNSW tuning ───────────────────────────────────────────────────────────────
+# hnsw.ef_search trades recall for QPS; small corpora don't need a wide search.
+# Thresholds follow the usual pgvector guidance by live row count.
+
+_hnsw_ef_search: int = 40
+
+
+def _ef_search_for(row_count: int) -> int:
+    if row_count < 100_000:
+        return 40
+    if row_count < 1_000_000:
+        return 100
+    return 200
+
+
+async def refresh_hnsw_tuning() -> None:
+    """Recompute hnsw.ef_search from the current chunk count (startup + post-ingest)."""
+    global _hnsw_ef_search
     try:
-        existing = supabase.table("users").select("id").eq("email", email).execute()
-        if existing.data:
-            raise ValueError("Email already registered")
+        count = await get_pool().fetchval("SELECT count(*) FROM document_chunks")
     except Exception as e:
-        logger.error(f"Error checking existing user: {e}")
-        raise RuntimeError(f"Database error: {str(e)}")
+        logger.warning(f"HNSW tuning query failed (keeping ef_search={_hnsw_ef_search}): {e}")
+        return
+    _hnsw_ef_search = _ef_search_for(count or 0)
+    logger.info(f"HNSW tuning: {count} chunks -> hnsw.ef_search={_hnsw_ef_search}")
 
-    hashed = hash_password(password)
+
+def _to_dict(record: asyncpg.Record) -> Dict:
+    """Convert an asyncpg Record to a plain dict with JSON-friendly values."""
+    row = dict(record)
+    for key, value in row.items():
+        if isinstance(value, uuid_lib.UUID):
+            row[key] = str(value)
+        elif isinstance(value, datetime):
+            row[key] = value.isoformat()
+    return row
+
+
+# ── Auth / Users ──────────────────────────────────────────────────────────────
+
+async def create_user(email: str, password: str, name: Optional[str] = None) -> Dict:
+    """Register a new user. Raises on duplicate email."""
+    # bcrypt is CPU-heavy — keep it off the event loop
+    hashed = await asyncio.to_thread(hash_password, password)
     try:
-        result = supabase.table("users").insert({
-            "email": email,
-            "password_hash": hashed,
-            "name": name or email.split("@")[0],
-        }).execute()
+        row = await get_pool().fetchrow(
+            """
+            INSERT INTO users (email, password_hash, name)
+            VALUES ($1, $2, $3)
+            RETURNING id, email, name, created_at
+            """,
+            email,
+            hashed,
+            name or email.split("@")[0],
+        )
+    except asyncpg.UniqueViolationError:
+        raise ValueError("Email already registered")
     except Exception as e:
-        logger.error(f"Supabase insert error: {e}")
-        # Check for unique constraint violation manually if needed, 
-        # but the select above should catch it.
+        logger.error(f"User insert error: {e}")
         raise RuntimeError(f"Failed to create user: {str(e)}")
 
-    if not result.data:
+    if not row:
         raise RuntimeError("Failed to create user: No data returned")
-    return result.data[0]
+    return _to_dict(row)
 
 
-def get_user_by_email(email: str) -> Optional[Dict]:
-    result = supabase.table("users").select("*").eq("email", email).execute()
-    return result.data[0] if result.data else None
+async def get_user_by_email(email: str) -> Optional[Dict]:
+    row = await get_pool().fetchrow("SELECT * FROM users WHERE email = $1", email)
+    return _to_dict(row) if row else None
 
 
-def get_user_by_id(user_id: str) -> Optional[Dict]:
-    result = supabase.table("users").select("id,email,name,created_at").eq("id", user_id).execute()
-    return result.data[0] if result.data else None
+async def get_user_by_id(user_id: str) -> Optional[Dict]:
+    row = await get_pool().fetchrow(
+        "SELECT id, email, name, created_at FROM users WHERE id = $1", user_id
+    )
+    return _to_dict(row) if row else None
 
 
 # ── Documents ─────────────────────────────────────────────────────────────────
 
-def create_document(user_id: str, filename: str, file_size: int) -> Dict:
-    result = supabase.table("documents").insert({
-        "user_id": user_id,
-        "filename": filename,
-        "file_size": file_size,
-        "status": "processing",
-    }).execute()
-    if not result.data:
+async def create_document(user_id: str, filename: str, file_size: int) -> Dict:
+    row = await get_pool().fetchrow(
+        """
+        INSERT INTO documents (user_id, filename, file_size, status)
+        VALUES ($1, $2, $3, 'processing')
+        RETURNING *
+        """,
+        user_id,
+        filename,
+        file_size,
+    )
+    if not row:
         raise RuntimeError("Failed to create document record")
-    return result.data[0]
+    return _to_dict(row)
 
 
-def get_documents_by_user(user_id: str) -> List[Dict]:
-    result = (
-        supabase.table("documents")
-        .select("id,filename,file_size,status,created_at")
-        .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .execute()
+async def get_chunk_counts(user_id: str, doc_ids: List[str]) -> Dict[str, int]:
+    """Count chunks per document in a single query (avoids N+1 round-trips)."""
+    if not doc_ids:
+        return {}
+    rows = await get_pool().fetch(
+        """
+        SELECT document_id, count(*) AS chunk_count
+        FROM document_chunks
+        WHERE user_id = $1 AND document_id = ANY($2::uuid[])
+        GROUP BY document_id
+        """,
+        user_id,
+        doc_ids,
     )
-    # Attach chunk counts
-    docs = result.data or []
-    for doc in docs:
-        count_result = (
-            supabase.table("document_chunks")
-            .select("id", count="exact")
-            .eq("document_id", doc["id"])
-            .execute()
-        )
-        doc["chunk_count"] = count_result.count or 0
-    return docs
+    return {str(r["document_id"]): r["chunk_count"] for r in rows}
 
 
-def get_document(doc_id: str, user_id: str) -> Optional[Dict]:
-    result = (
-        supabase.table("documents")
-        .select("*")
-        .eq("id", doc_id)
-        .eq("user_id", user_id)
-        .execute()
+async def get_documents_version(user_id: str) -> int:
+    """Monotonic per-user version of the document list (bumped by trigger)."""
+    version = await get_pool().fetchval(
+        "SELECT documents_version FROM users WHERE id = $1", user_id
+    )
+    return version or 0
+
+
+async def get_documents_by_user(user_id: str) -> List[Dict]:
+    # Chunk counts come from a grouped join — one round-trip for the whole list
+    rows = await get_pool().fetch(
+        """
+        SELECT d.id, d.filename, d.file_size, d.status, d.created_at,
+               count(c.id) AS chunk_count
+        FROM documents d
+        LEFT JOIN document_chunks c ON c.document_id = d.id
+        WHERE d.user_id = $1
+        GROUP BY d.id
+        ORDER BY d.created_at DESC
+        """,
+        user_id,
     )
-    if not result.data:
+    return [_to_dict(r) for r in rows]
+
+
+async def get_document(doc_id: str, user_id: str) -> Optional[Dict]:
+    row = await get_pool().fetchrow(
+        "SELECT * FROM documents WHERE id = $1 AND user_id = $2", doc_id, user_id
+    )
+    if not row:
         return None
-    
-    doc = result.data[0]
+    doc = _to_dict(row)
     # Attach chunk count
-    count_result = (
-        supabase.table("document_chunks")
-        .select("id", count="exact")
-        .eq("document_id", doc_id)
-        .execute()
-    )
-    doc["chunk_count"] = count_result.count or 0
+    counts = await get_chunk_counts(user_id, [doc_id])
+    doc["chunk_count"] = counts.get(doc_id, 0)
     return doc
 
 
-def update_document_status(doc_id: str, status: str) -> None:
-    supabase.table("documents").update({"status": status}).eq("id", doc_id).execute()
+async def get_documents_by_ids(user_id: str, doc_ids: List[str]) -> List[Dict]:
+    """Fetch id/filename/status for a set of the user's documents in one query."""
+    if not doc_ids:
+        return []
+    rows = await get_pool().fetch(
+        """
+        SELECT id, filename, status
+        FROM documents
+        WHERE user_id = $1 AND id = ANY($2::uuid[])
+        """,
+        user_id,
+        doc_ids,
+    )
+    return [_to_dict(r) for r in rows]
+
+
+async def update_document_status(doc_id: str, status: str) -> None:
+    await get_pool().execute(
+        "UPDATE documents SET status = $2 WHERE id = $1", doc_id, status
+    )
+
 
+def _remove_storage_object(path: str) -> None:
+    get_supabase().storage.from_("documents").remove([path])
 
-def delete_document(doc_id: str, user_id: str) -> bool:
+
+async def delete_document(doc_id: str, user_id: str) -> bool:
     """Delete document and all its chunks (cascaded by FK). Returns True on success."""
-    doc = get_document(doc_id, user_id)
-    if not doc:
+    # Single statement does the ownership check + delete server-side; chunks go
+    # via ON DELETE CASCADE. Returns the filename so we can clean up storage.
+    filename = await get_pool().fetchval(
+        "SELECT delete_user_document($1::uuid, $2::uuid)", doc_id, user_id
+    )
+    if not filename:
         return False
-    # Delete chunks first
-    supabase.table("document_chunks").delete().eq("document_id", doc_id).execute()
-    # Delete storage file
+    # Delete storage file (REST call — run in a thread)
     try:
-        storage_path = f"{user_id}/{doc_id}/{doc['filename']}"
-        supabase.storage.from_("documents").remove([storage_path])
+        storage_path = f"{user_id}/{doc_id}/{filename}"
+        await asyncio.to_thread(_remove_storage_object, storage_path)
     except Exception as e:
         logger.warning(f"Storage deletion failed (non-fatal): {e}")
-    # Delete document record
-    supabase.table("documents").delete().eq("id", doc_id).execute()
     return True
 
 
 # ── Document Chunks ───────────────────────────────────────────────────────────
 
-def insert_chunks(chunks: List[Dict]) -> None:
-    """Bulk-insert document chunks (with embeddings)."""
+async def insert_chunks(chunks: List[Dict]) -> None:
+    """Bulk-insert document chunks (with embeddings) via binary COPY."""
     if not chunks:
         return
-    # Insert in batches of 50
-    batch_size = 50
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i : i + batch_size]
-        supabase.table("document_chunks").insert(batch).execute()
+    records = [
+        (
+            c["document_id"],
+            c["user_id"],
+            c["chunk_index"],
+            c["sentence_text"],
+            c["window_text"],
+            HalfVector(c["embedding"]),
+            c["bm25_content"],
+            c["page_number"],
+        )
+        for c in chunks
+    ]
+    # COPY is the fastest Postgres ingestion path — one round-trip for the
+    # whole document instead of batched INSERT statements
+    async with get_pool().acquire() as conn:
+        await conn.copy_records_to_table(
+            "document_chunks",
+            records=records,
+            columns=[
+                "document_id",
+                "user_id",
+                "chunk_index",
+                "sentence_text",
+                "window_text",
+                "embedding",
+                "bm25_content",
+                "page_number",
+            ],
+        )
 
 
-def vector_search(
+async def vector_search(
     user_id: str,
     query_embedding: List[float],
     document_ids: Optional[List[str]] = None,
     top_k: int = 5,
 ) -> List[Dict]:
     """
-    Cosine similarity search via Supabase RPC function.
+    Cosine similarity search via the match_document_chunks SQL function.
     Scoped to user_id and optionally specific document_ids.
     """
-    params = {
-        "query_embedding": query_embedding,
-        "match_user_id": user_id,
-        "match_count": top_k,
-        "doc_ids": document_ids,
-    }
-    result = supabase.rpc("match_document_chunks", params).execute()
-    return result.data or []
-
-
-def get_chunks_for_bm25(
-    user_id: str, document_ids: Optional[List[str]] = None
+    # halfvec param: ~half the bytes on the wire vs fp32, binary-encoded.
+    # SET LOCAL scopes the tuned ef_search to this transaction only.
+    async with get_pool().acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL hnsw.ef_search = {_hnsw_ef_search}")
+            rows = await conn.fetch(
+                "SELECT * FROM match_document_chunks($1, $2::uuid, $3, $4::uuid[])",
+                HalfVector(query_embedding),
+                user_id,
+                top_k,
+                document_ids,
+            )
+    return [_to_dict(r) for r in rows]
+
+
+async def bm25_search(
+    user_id: str,
+    query_text: str,
+    document_ids: Optional[List[str]] = None,
+    top_k: int = 5,
 ) -> List[Dict]:
-    """Retrieve all chunks for BM25 indexing (text + metadata)."""
-    query = (
-        supabase.table("document_chunks")
-        .select("id,document_id,sentence_text,window_text,page_number,bm25_content")
-        .eq("user_id", user_id)
+    """
+    Keyword search ranked server-side with ts_rank_cd over the generated
+    tsvector column. Returns only the top-K rows instead of shipping the
+    whole corpus over the wire for in-process scoring.
+    """
+    rows = await get_pool().fetch(
+        """
+        SELECT id, document_id, sentence_text, window_text, page_number,
+               ts_rank_cd(bm25_tsv, plainto_tsquery('english', $2)) AS keyword_score
+        FROM document_chunks
+        WHERE user_id = $1
+          AND bm25_tsv @@ plainto_tsquery('english', $2)
+          AND ($3::uuid[] IS NULL OR document_id = ANY($3::uuid[]))
+        ORDER BY keyword_score DESC
+        LIMIT $4
+        """,
+        user_id,
+        query_text,
+        document_ids,
+        top_k,
     )
-    if document_ids:
-        query = query.in_("document_id", document_ids)
-    result = query.execute()
-    return result.data or []
+    return [_to_dict(r) for r in rows]
 
 
-def get_filenames_by_ids(doc_ids: List[str]) -> Dict[str, str]:
+async def get_filenames_by_ids(doc_ids: List[str]) -> Dict[str, str]:
     """Map document_id -> filename for citation display."""
     if not doc_ids:
         return {}
-    result = (
-        supabase.table("documents")
-        .select("id,filename")
-        .in_("id", doc_ids)
-        .execute()
+    rows = await get_pool().fetch(
+        "SELECT id, filename FROM documents WHERE id = ANY($1::uuid[])", doc_ids
     )
-    return {row["id"]: row["filename"] for row in (result.data or [])}
+    return {str(r["id"]): r["filename"] for r in rows}
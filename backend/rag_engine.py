@@ -14,65 +14,229 @@ Pipeline:
   5. Generation: OpenRouter free LLM (Llama-3.1-8b-instruct:free)
 """
 import asyncio
+import functools
+import heapq
+import multiprocessing
+import os
 import re
 import logging
-import nltk
-import requests
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from operator import itemgetter
+import httpx
 import numpy as np
-import time
 from typing import List, Dict, Any, Optional, Tuple
 from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
 from config import settings
 import database as db
 
 logger = logging.getLogger(__name__)
 
-# Download NLTK sentence tokenizer on first run
+# Sentence splitting: blingfire (compiled FST, orders of magnitude faster than
+# NLTK Punkt and no corpus download on cold start) with a compiled-regex
+# fallback for clean prose when blingfire isn't installed.
 try:
-    nltk.data.find("tokenizers/punkt_tab")
-except LookupError:
-    nltk.download("punkt_tab", quiet=True)
+    import blingfire
+except ImportError:
+    blingfire = None
 
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt", quiet=True)
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+_WS_RE = re.compile(r"\s+")
+
+# Sentences at or below this length are noise (headers, page numbers, bullets)
+_MIN_SENTENCE_LEN = 20
 
 
 # ── Singleton embedding model ─────────────────────────────────────────────────
-_embedding_model: Optional[SentenceTransformer] = None
+_embedding_model = None
 
 
-def get_embedding_model() -> SentenceTransformer:
+def get_embedding_model():
+    """Load the embedding model for the configured backend (cached singleton)."""
     global _embedding_model
     if _embedding_model is None:
-        logger.info(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
-        _embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        logger.info(
+            f"Loading embedding model: {settings.EMBEDDING_MODEL} "
+            f"(backend={settings.EMBEDDING_BACKEND})"
+        )
+        if settings.EMBEDDING_BACKEND == "model2vec":
+            # Static embeddings: token lookup + mean pool, no forward pass.
+            # EMBEDDING_MODEL must point at a model2vec checkpoint and the
+            # pgvector column must match its dimension (see config.py).
+            from model2vec import StaticModel
+
+            _embedding_model = StaticModel.from_pretrained(settings.EMBEDDING_MODEL)
+        elif settings.EMBEDDING_BACKEND == "onnx-int8":
+            # Dynamic-quantized int8 weights on ONNX Runtime — ~2-3x faster
+            # CPU inference than fp32 torch on VNNI-capable hosts, with
+            # negligible retrieval recall loss for MiniLM
+            try:
+                _embedding_model = SentenceTransformer(
+                    settings.EMBEDDING_MODEL,
+                    backend="onnx",
+                    model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"},
+                )
+            except Exception as e:
+                logger.warning(f"ONNX int8 backend unavailable ({e}); falling back to torch")
+                _embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        else:
+            import torch
+
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            _embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL, device=device)
+            if device == "cuda":
+                # FP16 halves VRAM and roughly doubles GPU throughput with no
+                # measurable retrieval-quality impact for MiniLM
+                _embedding_model.half()
+            logger.info(f"Embedding model on device: {device}")
+        if settings.EMBEDDING_BACKEND != "model2vec":
+            # Sentence-window anchors are single sentences; the default
+            # 256-token budget just doubles tokenization/padding cost
+            _embedding_model.max_seq_length = 128
         logger.info("Embedding model loaded.")
     return _embedding_model
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Encode texts to a (len(texts), dim) float32 array of unit vectors.
+
+    Returned as an ndarray end to end: downstream consumers (HalfVector for
+    pgvector, the query cache) all accept array rows, so converting to nested
+    Python lists here would only add an allocation pass per chunk.
+    """
     model = get_embedding_model()
-    embeddings = model.encode(texts, batch_size=32, normalize_embeddings=True)
-    return embeddings.tolist()
+    if settings.EMBEDDING_BACKEND == "model2vec":
+        # StaticModel.encode has no normalize kwarg — L2-normalize ourselves
+        # to keep cosine-search semantics identical across backends
+        embeddings = model.encode(texts)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+    if len(texts) <= 1:
+        return model.encode(texts, normalize_embeddings=True)
+
+    # Smart batching: encode in length order so each batch pads to similar
+    # lengths — mixed-length batches waste FLOPs on pad tokens — then restore
+    # the original order
+    order = np.argsort([len(t) for t in texts])
+    sorted_texts = [texts[i] for i in order]
+    sorted_embeddings = model.encode(
+        sorted_texts,
+        batch_size=64,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+
+@functools.lru_cache(maxsize=2048)
+def _embed_query_cached(normalized_text: str) -> tuple:
+    # Returns a tuple of plain floats because lru_cache values must be safe
+    # to share (single vector, so the conversion cost is negligible)
+    return tuple(embed_texts([normalized_text])[0].tolist())
 
 
 def embed_query(text: str) -> List[float]:
-    return embed_texts([text])[0]
+    # Normalize case/whitespace so trivial variants of a repeated question
+    # (reloads, retries) hit the cache and skip the encoder forward pass
+    normalized = " ".join(text.lower().split())
+    return list(_embed_query_cached(normalized))
+
+
+# ── Cross-request embedding micro-batcher ─────────────────────────────────────
+
+class EmbeddingBatcher:
+    """
+    Coalesces embed requests from concurrent ingestions into single encode
+    calls. Each request enqueues (texts, future); a worker task drains the
+    queue with a short time window so overlapping uploads share one
+    model.encode pass — wider matrices amortize the per-call framework
+    overhead and keep BLAS saturated.
+    """
+
+    def __init__(self, max_requests: int = 8, window_ms: float = 5.0):
+        self._max_requests = max_requests
+        self._window = window_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Fail whatever is still queued — otherwise callers awaiting embed()
+        # at shutdown hang forever instead of erroring out
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding batcher stopped"))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _worker(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            # Brief collection window to pick up concurrent requests
+            while len(batch) < self._max_requests:
+                try:
+                    batch.append(
+                        await asyncio.wait_for(self._queue.get(), timeout=self._window)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            all_texts = [t for texts, _ in batch for t in texts]
+            try:
+                embeddings = await asyncio.to_thread(embed_texts, all_texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for texts, future in batch:
+                if not future.done():
+                    # ndarray slice — a view, no per-request copy
+                    future.set_result(embeddings[offset : offset + len(texts)])
+                offset += len(texts)
+
+
+_embedding_batcher = EmbeddingBatcher()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    return _embedding_batcher
 
 
 # ── Document Processing ───────────────────────────────────────────────────────
 
 def split_into_sentences(text: str) -> List[str]:
-    """Split text into clean sentences using NLTK."""
-    try:
-        sentences = nltk.sent_tokenize(text)
-    except Exception:
-        # Fallback: split on period + newline patterns
-        sentences = re.split(r"(?<=[.!?])\s+", text)
-    return [s.strip() for s in sentences if len(s.strip()) > 20]
+    """Split text into clean sentences (blingfire, or regex boundaries)."""
+    if blingfire is not None:
+        sentences = blingfire.text_to_sentences(text).split("\n")
+    else:
+        sentences = _SENT_SPLIT_RE.split(text)
+    # Single pass: strip once per sentence and filter in the same comprehension
+    return [s for s in map(str.strip, sentences) if len(s) > _MIN_SENTENCE_LEN]
 
 
 def build_sentence_windows(
@@ -87,11 +251,21 @@ def build_sentence_windows(
     and "Sentence Window Retrieval" from Jerry Liu's RAG survey (2023)
     """
     w = window_size or settings.SENTENCE_WINDOW
+    n = len(sentences)
+
+    # Join all sentences once and slice windows out of the joined string by
+    # precomputed offsets — O(N) total instead of an O(W) join per anchor.
+    # offsets[i] is where sentence i starts in `joined` (separator included).
+    joined = " ".join(sentences)
+    offsets = [0] * (n + 1)
+    for i, sent in enumerate(sentences):
+        offsets[i + 1] = offsets[i] + len(sent) + 1
+
     windows = []
     for i, sent in enumerate(sentences):
         start = max(0, i - w)
-        end = min(len(sentences), i + w + 1)
-        window_text = " ".join(sentences[start:end])
+        end = min(n, i + w + 1)
+        window_text = joined[offsets[start] : offsets[end] - 1]
         windows.append({
             "sentence_text": sent,
             "window_text": window_text,
@@ -100,17 +274,61 @@ def build_sentence_windows(
     return windows
 
 
+# Below this page count, process-pool startup costs more than it saves
+_PDF_PARALLEL_MIN_PAGES = 16
+
+
+def _extract_page_range(file_bytes: bytes, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract raw text for pages [start, end). Top-level so workers can pickle it."""
+    import pypdf
+    from io import BytesIO
+
+    reader = pypdf.PdfReader(BytesIO(file_bytes))
+    return [
+        (page_num + 1, reader.pages[page_num].extract_text() or "")
+        for page_num in range(start, end)
+    ]
+
+
 def process_pdf(file_bytes: bytes, filename: str) -> List[Dict]:
     """Extract text from PDF and build sentence windows with page metadata."""
     import pypdf
     from io import BytesIO
 
     reader = pypdf.PdfReader(BytesIO(file_bytes))
-    all_windows = []
+    n_pages = len(reader.pages)
+
+    if n_pages >= _PDF_PARALLEL_MIN_PAGES:
+        # page.extract_text() is CPU-heavy — fan page ranges out to a process
+        # pool for large PDFs. Each worker reopens the PDF from the bytes it
+        # receives; ranges are submitted in order so results merge in order.
+        workers = min(os.cpu_count() or 2, 8, n_pages)
+        per_worker = -(-n_pages // workers)  # ceil division
+        page_texts: List[Tuple[int, str]] = []
+        # spawn, not fork: the server process is multithreaded (event loop,
+        # torch/OpenMP) and forking it can deadlock children on locks held at
+        # fork time. Workers only import pypdf, so spawn startup is cheap.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _extract_page_range, file_bytes, start, min(start + per_worker, n_pages)
+                )
+                for start in range(0, n_pages, per_worker)
+            ]
+            for future in futures:
+                page_texts.extend(future.result())
+    else:
+        page_texts = [
+            (page_num, page.extract_text() or "")
+            for page_num, page in enumerate(reader.pages, start=1)
+        ]
 
-    for page_num, page in enumerate(reader.pages, start=1):
-        text = page.extract_text() or ""
-        text = re.sub(r"\s+", " ", text).strip()
+    all_windows = []
+    for page_num, text in page_texts:
+        text = _WS_RE.sub(" ", text).strip()
         if not text:
             continue
 
@@ -128,7 +346,7 @@ def process_pdf(file_bytes: bytes, filename: str) -> List[Dict]:
 def process_text(file_bytes: bytes, filename: str) -> List[Dict]:
     """Process plain text files into sentence windows."""
     text = file_bytes.decode("utf-8", errors="replace")
-    text = re.sub(r"\s+", " ", text).strip()
+    text = _WS_RE.sub(" ", text).strip()
     sentences = split_into_sentences(text)
     windows = build_sentence_windows(sentences)
     for w in windows:
@@ -149,9 +367,13 @@ def build_chunks_for_db(
     windows: List[Dict],
     document_id: str,
     user_id: str,
-    embeddings: List[List[float]],
+    embeddings: np.ndarray,
 ) -> List[Dict]:
-    """Package windows + embeddings into DB row dicts."""
+    """Package windows + embeddings into DB row dicts.
+
+    Embedding rows stay ndarrays — insert_chunks hands them straight to
+    HalfVector, which takes arrays without an intermediate list.
+    """
     chunks = []
     for i, (w, emb) in enumerate(zip(windows, embeddings)):
         chunks.append({
@@ -161,7 +383,9 @@ def build_chunks_for_db(
             "sentence_text": w["sentence_text"],
             "window_text": w["window_text"],
             "embedding": emb,
-            "bm25_content": w["sentence_text"].lower(),
+            # to_tsvector normalizes case/punctuation server-side, so the raw
+            # sentence is stored as-is — no per-chunk Python string pass
+            "bm25_content": w["sentence_text"],
             "page_number": w.get("page_number", 1),
         })
     return chunks
@@ -193,16 +417,24 @@ async def ingest_document(
             raise ValueError("No text content extracted from document")
         logger.info(f"Extracted {len(windows)} sentence windows")
 
-        # Step 2: Embed anchor sentences — CPU-bound, offload to thread
+        # Step 2: Embed anchor sentences — CPU-bound, runs in a thread via the
+        # micro-batcher so concurrent uploads share encode calls
         texts_to_embed = [w["sentence_text"] for w in windows]
-        embeddings = await asyncio.to_thread(embed_texts, texts_to_embed)
+        batcher = get_embedding_batcher()
+        if batcher.running:
+            embeddings = await batcher.embed(texts_to_embed)
+        else:
+            embeddings = await asyncio.to_thread(embed_texts, texts_to_embed)
         logger.info(f"Generated {len(embeddings)} embeddings")
 
         # Step 3: Build chunk dicts and store in DB
         chunks = build_chunks_for_db(windows, document_id, user_id, embeddings)
-        await asyncio.to_thread(db.insert_chunks, chunks)
+        await db.insert_chunks(chunks)
         logger.info(f"Stored {len(chunks)} chunks in DB")
 
+        # Corpus grew — re-pick hnsw.ef_search for the new size
+        await db.refresh_hnsw_tuning()
+
         return len(chunks)
 
     except Exception as e:
@@ -213,7 +445,7 @@ async def ingest_document(
 # ── Hybrid Retrieval ──────────────────────────────────────────────────────────
 
 def reciprocal_rank_fusion(
-    ranked_lists: List[List[str]], k: int = 60
+    ranked_lists: List[List[str]], k: int = 60, top_k: Optional[int] = None
 ) -> List[Tuple[str, float]]:
     """
     Reciprocal Rank Fusion (RRF) — merges multiple ranked lists.
@@ -222,15 +454,27 @@ def reciprocal_rank_fusion(
 
     k=60 is the standard constant from the original paper.
     """
-    scores: Dict[str, float] = {}
+    max_len = max((len(rl) for rl in ranked_lists), default=0)
+    if max_len == 0:
+        return []
+
+    # Rank weights depend only on position — compute the divisions once and
+    # share them across all ranked lists
+    weights = [1.0 / (k + rank + 1) for rank in range(max_len)]
+
+    scores: Dict[str, float] = defaultdict(float)
     for ranked_list in ranked_lists:
         for rank, item_id in enumerate(ranked_list):
-            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+            scores[item_id] += weights[rank]
 
-    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    # When only the head of the fused ranking is needed, a heap selection is
+    # O(N log top_k) vs O(N log N) for the full sort
+    if top_k is not None and top_k < len(scores):
+        return heapq.nlargest(top_k, scores.items(), key=itemgetter(1))
+    return sorted(scores.items(), key=itemgetter(1), reverse=True)
 
 
-def hybrid_search(
+async def hybrid_search(
     user_id: str,
     query: str,
     document_ids: Optional[List[str]] = None,
@@ -241,7 +485,7 @@ def hybrid_search(
     """
     Hybrid search combining:
     - Dense vector search (cosine similarity with pgvector)
-    - Sparse BM25 search (TF-IDF-based keyword matching)
+    - Sparse keyword search (Postgres full-text, ts_rank_cd)
     Merged via Reciprocal Rank Fusion (RRF)
 
     Based on: "Dense Passage Retrieval for Open-Domain Question Answering" (Karpukhin et al., 2020)
@@ -251,42 +495,38 @@ def hybrid_search(
     tk_bm25 = top_k_bm25 or settings.TOP_K_BM25
     tk_final = top_k_final or settings.TOP_K_FINAL
 
-    # -- Dense vector search --
-    query_emb = embed_query(query)
-    vector_results = db.vector_search(
-        user_id=user_id,
-        query_embedding=query_emb,
-        document_ids=document_ids,
-        top_k=tk_vec,
+    # Keyword search doesn't need the query embedding, so kick it off first
+    # and embed (CPU-bound, in a thread) while it's in flight; then run the
+    # vector leg. Wall-clock cost becomes ~max(vector, bm25) instead of the sum.
+    bm25_task = asyncio.create_task(
+        db.bm25_search(user_id, query, document_ids, top_k=tk_bm25)
     )
+    query_emb = await asyncio.to_thread(embed_query, query)
+
+    vector_results, bm25_results = await asyncio.gather(
+        db.vector_search(
+            user_id=user_id,
+            query_embedding=query_emb,
+            document_ids=document_ids,
+            top_k=tk_vec,
+        ),
+        bm25_task,
+    )
+
     vector_ranked = [r["id"] for r in vector_results]
     chunk_map = {r["id"]: r for r in vector_results}
 
-    # -- Sparse BM25 search --
-    all_chunks = db.get_chunks_for_bm25(user_id, document_ids)
-    if all_chunks:
-        tokenized_corpus = [c["bm25_content"].split() for c in all_chunks]
-        bm25 = BM25Okapi(tokenized_corpus)
-        tokenized_query = query.lower().split()
-        bm25_scores = bm25.get_scores(tokenized_query)
-        top_bm25_indices = np.argsort(bm25_scores)[::-1][:tk_bm25]
-        bm25_ranked = [all_chunks[i]["id"] for i in top_bm25_indices if bm25_scores[i] > 0]
-
-        # Add BM25 results to chunk_map
-        for i in top_bm25_indices:
-            c = all_chunks[i]
-            if c["id"] not in chunk_map:
-                chunk_map[c["id"]] = c
-    else:
-        bm25_ranked = []
+    bm25_ranked = [r["id"] for r in bm25_results]
+    for c in bm25_results:
+        if c["id"] not in chunk_map:
+            chunk_map[c["id"]] = c
 
     # -- RRF fusion --
-    fused = reciprocal_rank_fusion([vector_ranked, bm25_ranked])
-    top_ids = [item_id for item_id, _ in fused[:tk_final]]
+    fused = reciprocal_rank_fusion([vector_ranked, bm25_ranked], top_k=tk_final)
 
     # Build result list with RRF scores
     results = []
-    for item_id, score in fused[:tk_final]:
+    for item_id, score in fused:
         chunk = chunk_map.get(item_id)
         if chunk:
             chunk["rrf_score"] = score
@@ -297,16 +537,9 @@ def hybrid_search(
 
 # ── LLM Generation ────────────────────────────────────────────────────────────
 
-def build_rag_prompt(question: str, context_chunks: List[Dict]) -> str:
-    """Build a structured RAG prompt with numbered source references."""
-    context_parts = []
-    for i, chunk in enumerate(context_chunks, start=1):
-        page_info = f" (Page {chunk.get('page_number', '?')})" if chunk.get("page_number") else ""
-        context_parts.append(f"[Source {i}{page_info}]:\n{chunk.get('window_text', chunk.get('sentence_text', ''))}")
-
-    context_text = "\n\n".join(context_parts)
-
-    return f"""You are an expert document analyst. Answer the user's question using ONLY the provided context.
+# Static prompt scaffolding built once at import — per question only the
+# context block and the question itself are interpolated
+_RAG_PROMPT_TEMPLATE = """You are an expert document analyst. Answer the user's question using ONLY the provided context.
 
 Guidelines:
 - Be concise and accurate
@@ -315,14 +548,46 @@ Guidelines:
 - Do NOT make up information not present in the context
 
 Context:
-{context_text}
+{context}
 
 Question: {question}
 
 Answer:"""
 
 
-def call_openrouter_llm(prompt: str) -> str:
+def build_rag_prompt(question: str, context_chunks: List[Dict]) -> str:
+    """Build a structured RAG prompt with numbered source references."""
+    context_parts = []
+    for i, chunk in enumerate(context_chunks, start=1):
+        page_info = f" (Page {chunk.get('page_number', '?')})" if chunk.get("page_number") else ""
+        context_parts.append(f"[Source {i}{page_info}]:\n{chunk.get('window_text', chunk.get('sentence_text', ''))}")
+
+    return _RAG_PROMPT_TEMPLATE.format_map(
+        {"context": "\n\n".join(context_parts), "question": question}
+    )
+
+
+# Shared async HTTP client: keeps the OpenRouter connection (and its TLS
+# handshake) pooled across requests instead of holding an executor thread
+# per blocking call. Closed from the lifespan handler on shutdown.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=60.0)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+async def call_openrouter_llm(prompt: str) -> str:
     """
     Call OpenRouter API with the free LLM.
     Includes retry logic with exponential backoff for 429 (Rate Limit) errors.
@@ -345,19 +610,18 @@ def call_openrouter_llm(prompt: str) -> str:
 
     for attempt in range(max_retries):
         try:
-            response = requests.post(
+            response = await get_http_client().post(
                 f"{settings.OPENROUTER_BASE_URL}/chat/completions",
                 headers=headers,
                 json=payload,
-                timeout=60,
             )
-            
+
             # Handle rate limiting specifically
             if response.status_code == 429:
                 if attempt < max_retries - 1:
                     delay = base_delay * (2 ** attempt)
                     logger.warning(f"Rate limited by OpenRouter. Retrying in {delay}s... (Attempt {attempt+1}/{max_retries})")
-                    time.sleep(delay)
+                    await asyncio.sleep(delay)
                     continue
                 else:
                     logger.error("OpenRouter rate limit exceeded after max retries.")
@@ -367,20 +631,20 @@ def call_openrouter_llm(prompt: str) -> str:
             data = response.json()
             return data["choices"][0]["message"]["content"].strip()
 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             if attempt < max_retries - 1:
                 logger.warning(f"OpenRouter timeout. Retrying... (Attempt {attempt+1}/{max_retries})")
                 continue
             return "The AI took too long to respond. Please try again."
-        except requests.exceptions.HTTPError as e:
-            if response.status_code == 429: # Handled above, but just in case
-                raise RuntimeError("AI service rate limit reached. Please wait a moment.")
+        except httpx.HTTPStatusError as e:
             logger.error(f"OpenRouter HTTP error: {e}")
-            raise RuntimeError(f"AI service error: {response.text}")
+            raise RuntimeError(f"AI service error: {e.response.text}")
+        except RuntimeError:
+            raise
         except Exception as e:
             logger.error(f"OpenRouter unexpected error: {e}")
             raise RuntimeError(f"LLM call failed: {str(e)}")
-    
+
     return "Failed to get an answer after multiple attempts."
 
 
@@ -428,26 +692,27 @@ def call_gemini_llm(prompt: str) -> str:
         raise RuntimeError(f"LLM call failed: {error_msg}")
 
 
-def call_llm(prompt: str) -> str:
+async def call_llm(prompt: str) -> str:
     """
     Route LLM calls to the configured provider.
     Provider is set via LLM_PROVIDER env var (default: "gemini").
+    OpenRouter is natively async; the Gemini SDK is blocking and runs in a thread.
     """
     provider = settings.LLM_PROVIDER.lower().strip()
     logger.info(f"Using LLM provider: {provider}")
 
     if provider == "gemini":
-        return call_gemini_llm(prompt)
+        return await asyncio.to_thread(call_gemini_llm, prompt)
     elif provider == "openrouter":
-        return call_openrouter_llm(prompt)
+        return await call_openrouter_llm(prompt)
     else:
         logger.warning(f"Unknown LLM provider '{provider}', falling back to Gemini")
-        return call_gemini_llm(prompt)
+        return await asyncio.to_thread(call_gemini_llm, prompt)
 
 
 # ── Full RAG Q&A Pipeline ─────────────────────────────────────────────────────
 
-def answer_question(
+async def answer_question(
     user_id: str,
     question: str,
     document_ids: Optional[List[str]] = None,
@@ -462,7 +727,7 @@ def answer_question(
     logger.info(f"Processing question for user {user_id}: {question[:80]}...")
 
     # Step 1: Retrieve
-    retrieved_chunks = hybrid_search(
+    retrieved_chunks = await hybrid_search(
         user_id=user_id,
         query=question,
         document_ids=document_ids,
@@ -477,11 +742,11 @@ def answer_question(
 
     # Step 2: Get filenames for citations
     doc_ids_used = list({c["document_id"] for c in retrieved_chunks})
-    filename_map = db.get_filenames_by_ids(doc_ids_used)
+    filename_map = await db.get_filenames_by_ids(doc_ids_used)
 
     # Step 3: Build prompt and call LLM
     prompt = build_rag_prompt(question, retrieved_chunks)
-    answer = call_llm(prompt)
+    answer = await call_llm(prompt)
 
     # Step 4: Build source citations
     sources = []
@@ -12,7 +12,8 @@ create table if not exists users (
   email text unique not null,
   password_hash text not null,
   name text,
-  created_at timestamptz default now()
+  created_at timestamptz default now(),
+  documents_version bigint not null default 0  -- bumped by trigger; backs ETag caching
 );
 
 -- ── Documents table ───────────────────────────────────────────────────────────
@@ -33,8 +34,9 @@ create table if not exists document_chunks (
   chunk_index integer not null,
   sentence_text text not null,     -- anchor sentence (embedded for search)
   window_text text not null,       -- anchor ± 2 neighbors (fed to LLM as context)
-  embedding vector(384),           -- all-MiniLM-L6-v2 dimensions
-  bm25_content text,               -- normalized text for BM25 keyword search
+  embedding halfvec(384),          -- all-MiniLM-L6-v2 dims, fp16 (half the storage, negligible recall loss)
+  bm25_content text,               -- normalized text for keyword search
+  bm25_tsv tsvector generated always as (to_tsvector('english', bm25_content)) stored,
   page_number integer default 1,
   created_at timestamptz default now()
 );
@@ -46,16 +48,30 @@ create index if not exists idx_documents_user_id on documents(user_id);
 create index if not exists idx_chunks_user_id on document_chunks(user_id);
 create index if not exists idx_chunks_document_id on document_chunks(document_id);
 
--- IVFFlat index for approximate nearest-neighbor vector search
--- Lists=100 is a good default for collections up to ~1M rows
+-- GIN index over the generated tsvector: keyword ranking happens server-side
+-- (Migrating an existing deployment:
+--    alter table document_chunks add column bm25_tsv tsvector
+--      generated always as (to_tsvector('english', bm25_content)) stored;)
+create index if not exists idx_chunks_bm25_tsv on document_chunks using gin(bm25_tsv);
+
+-- HNSW index for approximate nearest-neighbor vector search over halfvec
+-- (Migrating an existing deployment:
+--    alter table document_chunks alter column embedding
+--      type halfvec(384) using embedding::halfvec(384);
+--    drop index if exists idx_chunks_embedding;
+--  then re-run the create index below.)
+-- For large corpora (>100K chunks) build with wider graph parameters and
+-- enough memory, e.g.:
+--   set maintenance_work_mem = '2GB';
+--   create index ... using hnsw (embedding halfvec_cosine_ops)
+--     with (m = 24, ef_construction = 100);
 create index if not exists idx_chunks_embedding
-  on document_chunks using ivfflat (embedding vector_cosine_ops)
-  with (lists = 100);
+  on document_chunks using hnsw (embedding halfvec_cosine_ops);
 
 -- ── RPC: Hybrid vector similarity search ─────────────────────────────────────
 -- This function is called by the backend's vector_search() method
 create or replace function match_document_chunks(
-  query_embedding vector(384),
+  query_embedding halfvec(384),
   match_user_id uuid,
   match_count int,
   doc_ids uuid[] default null
@@ -90,6 +106,49 @@ as $$
   limit match_count;
 $$;
 
+-- ── Trigger: bump users.documents_version on document changes ────────────────
+-- Existing deployments: `create table if not exists users` above won't add the
+-- new column, but the trigger below is recreated unconditionally and would
+-- fail on every documents write without it — so add it in place here.
+alter table users add column if not exists documents_version bigint not null default 0;
+
+-- Lets GET /documents/ answer 304 Not Modified with a single cheap lookup.
+-- Chunk inserts don't bump it directly: the list only changes meaningfully
+-- when a document row is inserted/deleted or its status flips, all of which
+-- update the documents table.
+create or replace function bump_documents_version()
+returns trigger
+language plpgsql
+as $$
+begin
+  update users
+  set documents_version = documents_version + 1
+  where id = coalesce(new.user_id, old.user_id);
+  return coalesce(new, old);
+end;
+$$;
+
+drop trigger if exists trg_documents_version on documents;
+create trigger trg_documents_version
+  after insert or update or delete on documents
+  for each row execute function bump_documents_version();
+
+-- ── RPC: Ownership-checked document delete ───────────────────────────────────
+-- Deletes the document (chunks cascade via FK) in one round-trip and returns
+-- the filename so the backend can remove the storage object, or null if the
+-- document doesn't exist / isn't owned by the caller.
+create or replace function delete_user_document(
+  p_doc_id uuid,
+  p_user_id uuid
+)
+returns text
+language sql volatile
+as $$
+  delete from documents
+  where id = p_doc_id and user_id = p_user_id
+  returning filename;
+$$;
+
 -- ── Storage bucket for uploaded files ─────────────────────────────────────────
 -- Run in Supabase Dashboard > Storage > Create bucket named "documents" (private)
 -- Or use this SQL: